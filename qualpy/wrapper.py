@@ -8,30 +8,156 @@ Created on Sunday, 19th December 2021 7:54:09 pm
 @purpose:   module that contains the main wrapper class for the Qualtrics API
 ===============================================================================
 """
-import io
 import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Optional
+from typing import Iterator, Optional
 
+import orjson
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
 
-@dataclass
+def _json(r: requests.Response) -> dict:
+    """
+    decodes a json response body with orjson
+
+    Args:
+        r (requests.Response): response object
+
+    Returns:
+        dict: decoded body
+    """
+    return orjson.loads(r.content)
+
+
+def _is_text(series: pd.Series) -> bool:
+    """
+    whether a column holds text, either as a string dtype (the `read_csv`
+    default on pandas >= 3) or as an object column of strings
+
+    Args:
+        series (pd.Series): column to check
+
+    Returns:
+        bool: whether the column holds text
+    """
+    if pd.api.types.is_object_dtype(series):
+        return pd.api.types.infer_dtype(series, skipna=True) == 'string'
+
+    return pd.api.types.is_string_dtype(series)
+
+
+def _shrink(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    downcasts the columns of a dataframe in place to the narrowest dtype
+    that holds their values: integers to the smallest signed integer,
+    floats to float32 when that is lossless and low-cardinality strings to
+    categories.
+
+    narrow integers wrap around silently when `+`, `-` or `*` leaves their
+    range, and categorical columns reject values outside their categories,
+    so this is only meant for frames that are read rather than computed on.
+
+    Args:
+        df (pd.DataFrame): dataframe to shrink
+
+    Returns:
+        pd.DataFrame: the same dataframe with narrower dtypes
+    """
+    for col, series in df.items():
+        if pd.api.types.is_bool_dtype(series):
+            continue
+        elif pd.api.types.is_integer_dtype(series):
+            # signed, so small differences stay correct, but `+`, `-` and
+            # `*` still wrap around once the result leaves the narrow range
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series):
+            narrow = series.astype('float32')
+            if ((narrow == series) | series.isna()).all():
+                df[col] = narrow
+        elif _is_text(series) and len(series) and \
+                series.nunique() / len(series) < 0.5:
+            df[col] = series.astype('category')
+
+    return df
+
+
+@dataclass(slots=True)
 class QualtricsAPI:
     base_url: str
     library_id: str
-    api_token: str = field(repr=False, default=os.environ['QUAL_APIKEY'])
+    api_token: Optional[str] = field(repr=False, default=None)
+
+    # internal state set up in __post_init__, declared so it gets a slot
+    _headers: dict[str, str] = field(init=False, repr=False, compare=False)
+    _session: requests.Session = field(init=False, repr=False, compare=False)
+    # cache survey ids, name -> (id, fetch time)
+    _survey_id_cache: dict[str, tuple[str, float]] = field(
+        init=False, repr=False, compare=False)
+    # conditional GET cache, url -> (etag, last modified, decoded body)
+    _http_cache: dict[str, tuple[Optional[str], Optional[str], dict]] = field(
+        init=False, repr=False, compare=False)
+    # cache mailing lists, fetched lazily on first use
+    _mls: Optional[dict[str, dict]] = field(
+        init=False, repr=False, compare=False)
+    _mls_ts: float = field(init=False, repr=False, compare=False)
+
+    # seconds a cached survey id is considered fresh
+    _SURVEY_TTL = 300.0
+    # seconds the cached mailing lists are considered fresh
+    _MLS_TTL = 60.0
+    # fixed contact fields of every distribution record
+    _CONTACT_COLUMNS = ('contactid', 'email', 'language', 'unsubscribed')
 
     def __post_init__(self) -> None:
+        # read at instantiation rather than import time
+        if self.api_token is None:
+            self.api_token = os.environ['QUAL_APIKEY']
+
         self._headers = {
             'content-type': 'application/json',
             'x-api-token': self.api_token
         }
 
-        # cache mailing lists
-        self.mls = self._list_mailing_lists()
+        # pooled session, reuses connections across calls
+        self._session = requests.Session()
+        self._session.headers.update(self._headers)
+        adapter = HTTPAdapter(
+            pool_connections=32,
+            pool_maxsize=32,
+            max_retries=Retry(total=10,
+                              backoff_factor=0.3,
+                              status_forcelist=[429, 500, 502, 503, 504]))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+        self._survey_id_cache = {}
+        self._http_cache = {}
+        self._mls = None
+        self._mls_ts = 0.0
+
+    @property
+    def mls(self) -> dict[str, dict]:
+        """
+        mailing lists cached at the instance level. fetched on first access
+        and refreshed once older than `_MLS_TTL` seconds.
+
+        Returns:
+            dict[str, dict]: mailing list information keyed by name
+        """
+        if self._mls is None or \
+                time.monotonic() - self._mls_ts >= self._MLS_TTL:
+            self._mls = self._list_mailing_lists()
+            self._mls_ts = time.monotonic()
+
+        return self._mls
 
     def create_mailing_list(self,
                             name: str,
@@ -48,20 +174,25 @@ class QualtricsAPI:
         Returns:
             str: returns the created mailing list's id
         """
-        # check if mailing list exists
-        try:
+        # check if mailing list exists. membership is checked rather than
+        # catching KeyError so that a failed listing propagates instead of
+        # being taken for a missing mailing list
+        if name in self.mls:
             result = self.get_mailing_list_id(mlname=name)
-        except KeyError:
-            requests.post(
+        else:
+            r = self._session.post(
                 url=self._build_url('mailinglists'),
-                headers=self._headers,
                 json=dict(name=name,
                           libraryId=self.library_id,
                           category=category))
+            result = _json(r)['result']['id']
 
-            # update cache
-            self.mls = self._list_mailing_lists()
-            result = self.get_mailing_list_id(name)
+            # update cache directly, it has been populated above and going
+            # through `mls` could trigger a re-list
+            self._mls[name] = {'libraryId': self.library_id,
+                               'id': result,
+                               'category': category,
+                               'folder': None}
 
         return result
 
@@ -81,49 +212,74 @@ class QualtricsAPI:
         contacts = self._convert_df_to_contacts(df=contacts, **kwargs)
 
         url = self._build_url('mailinglists', mlid, 'contactimports')
-        response = requests.post(url=url,
-                                 headers=self._headers,
-                                 json={'contacts': contacts})
+        response = self._session.post(url=url, json={'contacts': contacts})
 
         return response
 
-    def get_all_surv_data(self, **kwargs) -> pd.DataFrame:
+    def get_all_surv_data(self,
+                          downcast: bool = False,
+                          **kwargs) -> pd.DataFrame:
         """
-        gets both finished and in progress responses for a single survey
+        gets both finished and in progress responses for a single survey.
+        both exports are requested concurrently.
+
+        Args:
+            downcast (bool, optional): narrow column dtypes to save memory,
+                applied once to the combined frame. see `_shrink` for the
+                caveats. Defaults to False.
 
         Returns:
             pd.DataFrame: response data
         """
-        auxs: list = []
-        for state in [False, True]:
-            aux = self._get_surv_data(finished_only=state, **kwargs)
-            aux['finished'] = state
-            auxs.append(aux)
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            # shrink after concatenating, categories differing between the
+            # two frames would otherwise be concatenated back to text
+            futs = {state: ex.submit(self._get_surv_data,
+                                     finished_only=state,
+                                     downcast=False,
+                                     **kwargs)
+                    for state in [False, True]}
+
+            auxs: list = []
+            for state, fut in futs.items():
+                aux = fut.result()
+                aux['finished'] = state
+                auxs.append(aux)
+
+        df = pd.concat(auxs)
+        if downcast:
+            df = _shrink(df)
 
-        return pd.concat(auxs)
+        return df
 
     def get_all_distribution_data(self,
                                   surv_name: str,
-                                  verbose: bool = False) -> pd.DataFrame:
+                                  verbose: bool = False,
+                                  max_workers: int = 5) -> pd.DataFrame:
         """
-        gets all email distribution data for a specific survey
+        gets all email distribution data for a specific survey. each
+        mailing list is paginated sequentially, but mailing lists are
+        fetched concurrently.
 
         Args:
             surv_name (str): survey name
             verbose (bool): verbose pagination report
+            max_workers (int): number of mailing lists fetched at once.
+                Defaults to 5.
 
         Returns:
             pd.DataFrame: email distribution detail
         """
         mailing_lists = self._get_distribution_ids(surv_name=surv_name)
 
-        auxs = []
-        for ml_id in mailing_lists.keys():
-            aux = self._get_distribution(ml_id=ml_id, verbose=verbose)
-            auxs.append(aux)
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            auxs = list(ex.map(
+                lambda ml_id: self._get_distribution(ml_id=ml_id,
+                                                     verbose=verbose),
+                mailing_lists.keys()))
 
+        # columns are already lowercased by _parse_distribution_page
         df = pd.concat(auxs, ignore_index=True)
-        df.columns = df.columns.str.lower()
 
         return df
 
@@ -161,7 +317,8 @@ class QualtricsAPI:
                        surv_name: str,
                        verbose: bool = True,
                        finished_only: bool = True,
-                       embedded_fields: list[str] = []
+                       embedded_fields: list[str] = [],
+                       downcast: bool = False
                        ) -> pd.DataFrame:
         """
         export current data for a specific survey id into a pandas dataframe
@@ -170,6 +327,8 @@ class QualtricsAPI:
             surv_name (str): survey name
             verbose (bool, optional): whether progress is printed
             complete (bool, optional): only export completed responses
+            downcast (bool, optional): narrow column dtypes to save memory.
+                see `_shrink` for the caveats. Defaults to False.
 
         Raises:
             Exception: download failed for some reason
@@ -179,9 +338,8 @@ class QualtricsAPI:
         """
         # set up values
         prog_status = 'inProgress'
-        url = self._build_url('surveys',
-                              self._get_survey_id(surv_name),
-                              'export-responses')
+        surv_id = self._get_survey_id(surv_name)
+        export_url = self._build_url('surveys', surv_id, 'export-responses')
 
         data_kwds = {'format': 'csv',
                      'useLabels': True,
@@ -191,34 +349,31 @@ class QualtricsAPI:
         ready = None
 
         # start up download from server
-        dl_req = requests.post(url=url,
-                               headers=self._headers,
-                               json=data_kwds)
+        dl_req = self._session.post(url=export_url, json=data_kwds)
 
-        prog_id = dl_req.json()['result']['progressId']
-        prog_status = dl_req.json()['result']['status']
+        dl_result = _json(dl_req)['result']
+        prog_id = dl_result['progressId']
+        prog_status = dl_result['status']
 
-        # check on progress
+        # check on progress, backing off exponentially between polls
+        req_check_url = f'{export_url}/{prog_id}'
+        attempt: int = 0
         while prog_status != 'complete' and \
                 prog_status != 'failed' and \
                 ready is None:
-            req_check_url = self._build_url('surveys',
-                                            self._get_survey_id(surv_name),
-                                            'export-responses',
-                                            prog_id)
-            req_check_resp = requests.get(url=req_check_url,
-                                          headers=self._headers)
-            req_check_prog = req_check_resp.json()['result']['percentComplete']
+            if attempt:
+                time.sleep(min(5.0, 0.25 * 2 ** min(attempt, 5)))
+            attempt += 1
+
+            req_check_resp = self._session.get(url=req_check_url)
+            progress = _json(req_check_resp)['result']
+            req_check_prog = progress['percentComplete']
 
             if ready is None and verbose:
                 print(f'Progress = {req_check_prog:.2f}')
 
-            try:
-                ready = req_check_resp.json()['result']['fileId']
-            except KeyError:
-                pass
-
-            prog_status = req_check_resp.json()['result']['status']
+            ready = progress.get('fileId')
+            prog_status = progress['status']
 
         if prog_status == 'complete' and verbose:
             print('Progress = Done')
@@ -227,29 +382,32 @@ class QualtricsAPI:
         if prog_status == 'failed':
             raise Exception('export failed')
 
-        file_id = req_check_resp.json()['result']['fileId']
+        file_id = progress['fileId']
 
         # download file
-        req_dl_url = self._build_url('surveys',
-                                     self._get_survey_id(surv_name),
-                                     'export-responses',
-                                     file_id,
-                                     'file')
-        req_dl = requests.get(url=req_dl_url,
-                              headers=self._headers,
-                              stream=True)
-
-        # extract from zip into pandas dataframe
-        df = pd.read_csv(io.BytesIO(req_dl.content),
-                         compression='zip',
-                         low_memory=False)
-
-        # drop qualtric headers
-        df = df.iloc[2:, :].copy()
-        df.reset_index(inplace=True, drop=True)
+        req_dl_url = f'{export_url}/{file_id}/file'
+        # stream into a spooled buffer that only spills to disk for large
+        # exports, then extract from zip into pandas dataframe
+        with self._session.get(url=req_dl_url, stream=True) as req_dl, \
+                tempfile.SpooledTemporaryFile(max_size=64 << 20) as fh:
+            req_dl.raw.decode_content = True
+            shutil.copyfileobj(req_dl.raw, fh)
+            fh.seek(0)
+
+            # skip the two qualtrics header rows below the column names.
+            # values are kept as strings, as they were when those rows were
+            # parsed along, so ids and zip codes keep their leading zeros
+            df = pd.read_csv(fh,
+                             compression='zip',
+                             low_memory=False,
+                             skiprows=[1, 2],
+                             dtype=object)
 
         # lowercase cols
-        df.columns = df.columns.str.lower()
+        df.columns = [col.lower() for col in df.columns]
+
+        if downcast:
+            df = _shrink(df)
 
         return df
 
@@ -264,10 +422,10 @@ class QualtricsAPI:
         Returns:
             dict: dictionary with distribution ids and date sents (ISO)
         """
-        r = requests.get(url=self._build_url('distributions'),
-                         headers=self._headers,
-                         params={'surveyId': self._get_survey_id(surv_name)})
-        results = r.json()['result']['elements']
+        r = self._session.get(
+            url=self._build_url('distributions'),
+            params={'surveyId': self._get_survey_id(surv_name)})
+        results = _json(r)['result']['elements']
 
         dists: dict[str, dict] = {}
         for result in results:
@@ -295,32 +453,35 @@ class QualtricsAPI:
             ml_id (str): mailing list id
 
         Returns:
-            pd.DataFrame: distribution history
+            pd.DataFrame: distribution history, with lowercase column names
         """
         url = self._build_url('mailinglists', ml_id, 'contacts')
-        r = requests.get(url, headers=self._headers)
-        nextPage = r.json()['result']['nextPage']
+        data = _json(self._session.get(url))['result']
+        nextPage = data['nextPage']
 
         # parse request
-        dfs = []
-        dfs.extend(self._parse_distribution_page(r))
+        rows: list[dict] = []
+        rows.extend(self._parse_distribution_page(data['elements']))
 
         count: int = 0
         while nextPage is not None:
-            r = requests.get(nextPage, headers=self._headers)
-            data = r.json()
+            data = _json(self._session.get(nextPage))['result']
 
             count += 1
-            nrecords = len(data['result']['elements'])
+            nrecords = len(data['elements'])
 
             if verbose:
                 print(f'Working on page {count} with {nrecords} records.')
 
-            dfs.extend(self._parse_distribution_page(r))
-            nextPage = data['result']['nextPage']
+            rows.extend(self._parse_distribution_page(data['elements']))
+            nextPage = data['nextPage']
 
-        # # cast into a df
-        df = pd.DataFrame(dfs)
+        # cast into a df, keeping the contact columns when the mailing list
+        # has no email history
+        if not rows:
+            return pd.DataFrame(columns=list(self._CONTACT_COLUMNS))
+
+        df = pd.DataFrame.from_records(rows)
 
         return df
 
@@ -340,40 +501,24 @@ class QualtricsAPI:
             pd.DataFrame: distribution links with contact ids
         """
         url = self._build_url('distributions', dist_id, 'links')
-        r = requests.get(url,
-                         headers=self._headers,
-                         params={'surveyId': self._get_survey_id(surv_name)})
-        nextPage = r.json()['result']['nextPage']
+        r = self._session.get(
+            url, params={'surveyId': self._get_survey_id(surv_name)})
+        data = _json(r)['result']
+        nextPage = data['nextPage']
         count = 1
 
         # parse request
         dfs = []
-        dfs.append(pd.DataFrame(r.json()['result']['elements']))
+        dfs.append(pd.DataFrame(data['elements']))
+        # transient failures are retried by the session's adapter
         while nextPage is not None:
-            for attempt in range(10):
-                try:
-                    count += 1
-                    r = requests.get(nextPage, headers=self._headers)
-                    df = pd.DataFrame(r.json()['result']['elements'])
-                    dfs.append(df)
-                    nextPage = r.json()['result']['nextPage']
-                    if verbose:
-                        print(
-                            f'Working on page {count} with {len(df)} records.')
-                except KeyError:
-                    count += 1
-                    r = requests.get(nextPage, headers=self._headers)
-                    df = pd.DataFrame(r.json()['result']['elements'])
-                    dfs.append(df)
-                    nextPage = r.json()['result']['nextPage']
-                    if verbose:
-                        print(
-                            f'Working on page {count} with {len(df)} records.')
-                else:
-                    break
-            else:
-                raise KeyError(
-                    'Tried 10 attempts with a failure.')
+            count += 1
+            data = _json(self._session.get(nextPage))['result']
+            df = pd.DataFrame(data['elements'])
+            dfs.append(df)
+            nextPage = data['nextPage']
+            if verbose:
+                print(f'Working on page {count} with {len(df)} records.')
 
         # # cast into a df
         df = pd.concat(dfs, ignore_index=True)
@@ -394,41 +539,79 @@ class QualtricsAPI:
             ValueError: this is raised when duplicated mailing list names are
                 detected on the Qualtrics account used via API key.
         """
-        response = requests.get(
-            url=self._build_url('mailinglists'),
-            headers=self._headers)
+        response = self._conditional_get(self._build_url('mailinglists'))
 
-        mailing_lists = response.json()['result']['elements']
+        mailing_lists = response['result']['elements']
 
-        # check for duplicates
-        names = set(ml['name'] for ml in mailing_lists)
+        # don't mutate the elements, they may be served again from the
+        # conditional GET cache
+        results: dict[str, dict] = {}
+        for ml in mailing_lists:
+            name = ml['name']
 
-        if len(names) != len(mailing_lists):
-            raise ValueError(
-                'There are duplicate names for mailing lists. This program '
-                'assumes that the names are unique and casts these into a set '
-                'therefore some information might be lost. Please make sure '
-                'that there are no duplicate names for mailing lists.'
-            )
+            # check for duplicates
+            if name in results:
+                raise ValueError(
+                    'There are duplicate names for mailing lists, '
+                    f'{name!r} appears more than once. This program keys '
+                    'mailing lists by name and assumes that the names are '
+                    'unique. Please make sure that there are no duplicate '
+                    'names for mailing lists.'
+                )
 
-        results = {ml.pop('name'): ml for ml in mailing_lists}
+            results[name] = {k: v for k, v in ml.items() if k != 'name'}
 
         return results
 
-    def _list_surveys(self) -> requests.Response:
+    def _list_surveys(self) -> dict:
         """
         Returns meta data for all surveys available to the user.
 
         Returns:
-            requests.Response: response object
+            dict: decoded response body
         """
-        r = requests.get(url=self._build_url('surveys'), headers=self._headers)
+        r = self._conditional_get(self._build_url('surveys'))
 
         return r
 
+    def _conditional_get(self, url: str) -> dict:
+        """
+        issues a GET revalidating against the `ETag` / `Last-Modified` of a
+        previous response to the same url. on `304 Not Modified` the body
+        decoded last time is returned without being transferred again.
+
+        Args:
+            url (str): url to fetch
+
+        Returns:
+            dict: decoded response body
+        """
+        headers = {}
+        cached = self._http_cache.get(url)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag is not None:
+                headers['If-None-Match'] = etag
+            if last_modified is not None:
+                headers['If-Modified-Since'] = last_modified
+
+        r = self._session.get(url=url, headers=headers)
+        if r.status_code == 304 and cached is not None:
+            return cached[2]
+
+        data = _json(r)
+        etag = r.headers.get('ETag')
+        last_modified = r.headers.get('Last-Modified')
+        if etag is not None or last_modified is not None:
+            self._http_cache[url] = (etag, last_modified, data)
+
+        return data
+
     def _get_survey_id(self, suname: str) -> str:
         """
-        fetches the survey id corresponding to a survey name
+        fetches the survey id corresponding to a survey name. ids are cached
+        at the instance level for `_SURVEY_TTL` seconds; a miss or a stale
+        entry refreshes the cache for all surveys with one request.
 
         Args:
             suname (str): survey name
@@ -440,16 +623,23 @@ class QualtricsAPI:
         Returns:
             str: survey id
         """
-        surveys = self._list_surveys().json()['result']['elements']
-        suid = None
+        cached = self._survey_id_cache.get(suname)
+        if cached is not None and \
+                time.monotonic() - cached[1] < self._SURVEY_TTL:
+            return cached[0]
+
+        surveys = self._list_surveys()['result']['elements']
+        ts = time.monotonic()
+        cache: dict[str, tuple[str, float]] = {}
         for survey in surveys:
-            if survey['name'] == suname:
-                suid = survey['id']
-                break
-        if suid is None:
+            # keep the first match, as the previous linear search did
+            cache.setdefault(survey['name'], (survey['id'], ts))
+        self._survey_id_cache = cache
+
+        if suname not in cache:
             raise ValueError('survey does not exist')
 
-        return suid
+        return cache[suname][0]
 
     def _get_mailing_list_attr(self, mlname: str, key: str) -> str:
         """
@@ -498,20 +688,28 @@ class QualtricsAPI:
         if isinstance(ecols, str):
             ecols = [ecols]
 
+        # check that emails are unique
+        assert df[emailcol].is_unique
+
+        subset_cols = [emailcol]
+        if langcol is not None:
+            subset_cols.append(langcol)
+        if ecols is not None:
+            subset_cols.extend(ecols)
+
+        # dedupe in case a column is also passed as embedded data
+        records = df[list(dict.fromkeys(subset_cols))].to_dict('records')
+
         contacts = []
-        for row in df.itertuples():
-            contact_data = {}
-            contact_data['email'] = getattr(row, emailcol)
+        for record in records:
+            contact_data = {'email': record[emailcol]}
             if langcol is not None:
-                contact_data['language'] = getattr(row, langcol)
+                contact_data['language'] = record[langcol]
             if ecols is not None:
-                edata = dict(zip(ecols, [getattr(row, col) for col in ecols]))
-                contact_data['embeddedData'] = edata
+                contact_data['embeddedData'] = {col: record[col]
+                                                for col in ecols}
             contacts.append(contact_data)
 
-        # check that emails are unique
-        assert len(set(contact['email'] for contact in contacts)) == len(df)
-
         return contacts
 
     def _create_distribution_links(self,
@@ -530,20 +728,29 @@ class QualtricsAPI:
         """
         ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         mlid = self.get_mailing_list_id(mlname)
-        r = requests.post(url=self._build_url('distributions'),
-                          headers=self._headers,
-                          json=dict(surveyId=self._get_survey_id(suname),
-                                    linkType='Individual',
-                                    action='CreateDistribution',
-                                    description=f'dist {ts}',
-                                    mailingListId=mlid))
+        r = self._session.post(
+            url=self._build_url('distributions'),
+            json=dict(surveyId=self._get_survey_id(suname),
+                      linkType='Individual',
+                      action='CreateDistribution',
+                      description=f'dist {ts}',
+                      mailingListId=mlid))
 
         return r
 
-    def _parse_distribution_page(self, r: requests.Response) -> list:
-        p_df = []
+    def _parse_distribution_page(self, elements: list[dict]
+                                 ) -> Iterator[dict]:
+        """
+        yields one record per email history entry of each contact on a
+        distribution page. keys are emitted lowercase.
 
-        for person in r.json()['result']['elements']:
+        Args:
+            elements (list[dict]): contacts on the page
+
+        Yields:
+            dict: contact fields merged with one email history entry
+        """
+        for person in elements:
             p_dict = {
                 'contactid': person['id'],
                 'email': person['email'],
@@ -552,6 +759,7 @@ class QualtricsAPI:
             }
 
             for email in person['emailHistory']:
-                p_df.append(p_dict | email)
-
-        return p_df
+                record = p_dict.copy()
+                for key, value in email.items():
+                    record[key.lower()] = value
+                yield record
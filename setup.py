@@ -7,6 +7,7 @@ setuptools.setup(
     name="qualpy",
     version="0.0.1",
     install_requires=[
+        'orjson',
         'pandas',
         'requests'
         ],
@@ -25,7 +26,7 @@ setuptools.setup(
         "Operating System :: OS Independent",
     ],
     packages=setuptools.find_packages(),
-    python_requires=">=3.9",
+    python_requires=">=3.10",
     keywords=[
         'qualtrics',
         'qualpy',